@@ -11,14 +11,17 @@ runtime: https://github.com/PINTO0309/TensorflowLite-bin
 from __future__ import annotations
 import os
 import sys
-import copy
 import cv2
 import time
+import queue
+import hashlib
+import threading
 import numpy as np
 from enum import Enum
 from dataclasses import dataclass
 from argparse import ArgumentParser
-from typing import Tuple, Optional, List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, Optional, List, Dict, Union
 import importlib.util
 from abc import ABC, abstractmethod
 
@@ -53,6 +56,14 @@ class Color(Enum):
     def __call__(self, s):
         return str(self) + str(s) + str(Color.RESET)
 
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+# BGR box colors indexed by classid: Body, Head, Hand
+BOX_COLORS = (
+    (255, 0, 0),
+    (0, 0, 255),
+    (0, 255, 0),
+)
+
 @dataclass(frozen=False)
 class Box():
     classid: int
@@ -85,9 +96,14 @@ class AbstractModel(ABC):
     # onnx
     _onnx_dtypes_to_np_dtypes = {
         "tensor(float)": np.float32,
+        "tensor(float16)": np.float16,
         "tensor(uint8)": np.uint8,
         "tensor(int8)": np.int8,
     }
+    _input_ortvalues = None
+    _input_bufs = None
+    _io_binding = None
+    _static_input_shapes = None
 
     # tflite
     _input_details = None
@@ -106,6 +122,7 @@ class AbstractModel(ABC):
                     'trt_engine_cache_enable': True,
                     'trt_engine_cache_path': '.',
                     'trt_fp16_enable': True,
+                    'trt_builder_optimization_level': 5,
                 }
             ),
             'CUDAExecutionProvider',
@@ -122,13 +139,41 @@ class AbstractModel(ABC):
             import onnxruntime # type: ignore
             session_option = onnxruntime.SessionOptions()
             session_option.log_severity_level = 3
-            self._interpreter = \
-                onnxruntime.InferenceSession(
-                    model_path,
-                    sess_options=session_option,
-                    providers=providers,
-                )
+            # Session construction raises when the CUDA/TensorRT runtime
+            # libraries are missing. Retry with progressively shorter
+            # provider lists down to CPU so the demo still starts on
+            # machines without the GPU stack.
+            provider_attempts = [providers]
+            if providers is not None and len(providers) > 1:
+                provider_attempts += [providers[1:], providers[-1:]]
+            self._interpreter = None
+            last_error = None
+            for provider_attempt in provider_attempts:
+                try:
+                    self._interpreter = \
+                        onnxruntime.InferenceSession(
+                            model_path,
+                            sess_options=session_option,
+                            providers=provider_attempt,
+                        )
+                    break
+                except (RuntimeError, OSError) as e:
+                    last_error = e
+                    if provider_attempt is None:
+                        provider_name = 'The default providers'
+                    elif isinstance(provider_attempt[0], tuple):
+                        provider_name = provider_attempt[0][0]
+                    else:
+                        provider_name = provider_attempt[0]
+                    print(Color.YELLOW(f'WARNING: {provider_name} could not be initialized. Falling back to the next provider.'))
+            if self._interpreter is None:
+                raise last_error
             self._providers = self._interpreter.get_providers()
+            # When a GPU EP is active, fail fast instead of silently
+            # degrading to CPU mid-run.
+            if self._providers \
+                and self._providers[0] in ['TensorrtExecutionProvider', 'CUDAExecutionProvider']:
+                self._interpreter.disable_fallback()
             self._input_shapes = [
                 input.shape for input in self._interpreter.get_inputs()
             ]
@@ -149,6 +194,55 @@ class AbstractModel(ABC):
             self._h_index = 2
             self._w_index = 3
 
+            # NHWC exports (the boundary transpose folded into the
+            # graph) take OpenCV's native HWC output directly, skipping
+            # the Python-side CHW shuffle.
+            if len(self._input_shapes[0]) == 4 \
+                and self._input_shapes[0][-1] == 3:
+                self._swap = (0, 1, 2)
+                self._h_index = 1
+                self._w_index = 2
+
+            # Persistent input tensors reused across frames.
+            # Writing the preprocessed blob into a fixed OrtValue avoids
+            # a per-frame allocation and lets GPU EPs stage the H2D copy
+            # from stable memory; with a GPU EP the tensor lives on the
+            # device itself.
+            static_input_shapes = all(
+                isinstance(dim, int) for shape in self._input_shapes for dim in shape
+            )
+            if static_input_shapes:
+                self._static_input_shapes = [
+                    tuple(shape) for shape in self._input_shapes
+                ]
+                if self._providers[0] in ['TensorrtExecutionProvider', 'CUDAExecutionProvider']:
+                    self._input_ortvalues = {
+                        input_name: onnxruntime.OrtValue.ortvalue_from_shape_and_type(
+                            input_shape, input_dtype, 'cuda', 0,
+                        ) for input_name, input_shape, input_dtype \
+                            in zip(self._input_names, self._input_shapes, self._input_dtypes)
+                    }
+                else:
+                    self._input_bufs = [
+                        np.zeros(input_shape, dtype=input_dtype) \
+                            for input_shape, input_dtype \
+                                in zip(self._input_shapes, self._input_dtypes)
+                    ]
+                    self._input_ortvalues = {
+                        input_name: onnxruntime.OrtValue.ortvalue_from_numpy(input_buf) \
+                            for input_name, input_buf \
+                                in zip(self._input_names, self._input_bufs)
+                    }
+            if self._input_ortvalues is not None and self._input_bufs is None:
+                # Device-resident inputs: bind input/output tensors once
+                # so run_with_iobinding submits the whole launch sequence
+                # without per-call staging.
+                self._io_binding = self._interpreter.io_binding()
+                for input_name, input_ortvalue in self._input_ortvalues.items():
+                    self._io_binding.bind_ortvalue_input(input_name, input_ortvalue)
+                for output_name in self._output_names:
+                    self._io_binding.bind_output(output_name, 'cuda')
+
         elif self._runtime in ['tflite_runtime', 'tensorflow']:
             if self._runtime == 'tflite_runtime':
                 from tflite_runtime.interpreter import Interpreter # type: ignore
@@ -178,22 +272,60 @@ class AbstractModel(ABC):
             self._h_index = 1
             self._w_index = 2
 
+        self._input_name0 = \
+            self._input_names[0] if len(self._input_names) == 1 else None
+
+        # Input geometry resolved once so the per-frame code avoids
+        # repeated attribute lookups, int casts and divides.
+        self._input_h = int(self._input_shapes[0][self._h_index])
+        self._input_w = int(self._input_shapes[0][self._w_index])
+        self._input_size = (self._input_w, self._input_h)
+
+        # Fixed-size resize destination reused across frames so
+        # cv2.resize writes in place instead of allocating per call.
+        self._resize_buf = np.empty(
+            (self._input_h, self._input_w, 3),
+            dtype=np.uint8,
+        )
+
     @abstractmethod
     def __call__(
         self,
         *,
         input_datas: List[np.ndarray],
     ) -> List[np.ndarray]:
-        datas = {
-            f'{input_name}': input_data \
-                for input_name, input_data in zip(self._input_names, input_datas)
-        }
         if self._runtime == 'onnx':
+            if self._input_ortvalues is not None \
+                and all(
+                    input_data.shape == static_shape \
+                        for input_data, static_shape \
+                            in zip(input_datas, self._static_input_shapes)
+                ):
+                if self._input_bufs is not None:
+                    for input_buf, input_data in zip(self._input_bufs, input_datas):
+                        np.copyto(input_buf, input_data)
+                else:
+                    for input_ortvalue, input_data in zip(self._input_ortvalues.values(), input_datas):
+                        input_ortvalue.update_inplace(input_data)
+                if self._io_binding is not None:
+                    self._interpreter.run_with_iobinding(self._io_binding)
+                    outputs = [
+                        output.numpy() for output in self._io_binding.get_outputs()
+                    ]
+                    return outputs
+                outputs = [
+                    output.numpy() for output in \
+                        self._interpreter.run_with_ort_values(
+                            self._output_names,
+                            self._input_ortvalues,
+                        )
+                ]
+                return outputs
             outputs = [
                 output for output in \
                     self._model(
                         output_names=self._output_names,
-                        input_feed=datas,
+                        input_feed=self._input_feed(input_datas),
                     )
             ]
             return outputs
@@ -201,17 +333,29 @@ class AbstractModel(ABC):
             outputs = [
                 output for output in \
                     self._model(
-                        **datas
+                        **self._input_feed(input_datas)
                     ).values()
             ]
             return outputs
 
+    def _input_feed(
+        self,
+        input_datas: List[np.ndarray],
+    ) -> Dict[str, np.ndarray]:
+        # Single-input models (the common case) skip the per-frame
+        # dict comprehension over input_names.
+        if self._input_name0 is not None:
+            return {self._input_name0: input_datas[0]}
+        return {
+            f'{input_name}': input_data \
+                for input_name, input_data in zip(self._input_names, input_datas)
+        }
+
     @abstractmethod
     def _preprocess(
         self,
         *,
         image: np.ndarray,
-        swap: Optional[Tuple[int,int,int]] = (2, 0, 1),
     ) -> np.ndarray:
         pass
 
@@ -258,44 +402,55 @@ class YOLOX(AbstractModel):
 
     def __call__(
         self,
-        image: np.ndarray,
-    ) -> List[Box]:
+        image: Union[np.ndarray, List[np.ndarray]],
+    ) -> Union[List[Box], List[List[Box]]]:
         """YOLOX
 
         Parameters
         ----------
-        image: np.ndarray
-            Entire image
+        image: Union[np.ndarray, List[np.ndarray]]
+            Entire image, or a list of images inferred as one batch.
+            Batches larger than 1 require a model exported with a
+            dynamic batch dimension.
 
         Returns
         -------
-        boxes: np.ndarray
-            Predicted boxes: [N, x1, y1, x2, y2]
-
-        scores: np.ndarray
-            Predicted box scores: [N, score]
+        result_boxes: Union[List[Box], List[List[Box]]]
+            Predicted boxes, one list per image when a list was passed.
         """
-        temp_image = copy.deepcopy(image)
+        images = image if isinstance(image, list) else [image]
 
         # PreProcess
-        resized_image = \
-            self._preprocess(
-                temp_image,
+        if len(images) == 1:
+            inferece_image = \
+                self._preprocess(
+                    images[0],
+                )
+        else:
+            # Copy each preprocessed frame into the batch buffer before
+            # the next one reuses the shared resize destination.
+            first_image = self._preprocess(images[0])
+            inferece_image = np.empty(
+                (len(images),) + first_image.shape[1:],
+                dtype=first_image.dtype,
             )
+            inferece_image[0] = first_image[0]
+            for batchno, temp_image in enumerate(images[1:], start=1):
+                inferece_image[batchno] = self._preprocess(temp_image)[0]
 
         # Inference
-        inferece_image = np.asarray([resized_image], dtype=self._input_dtypes[0])
         outputs = super().__call__(input_datas=[inferece_image])
         boxes = outputs[0]
 
-        # PostProcess
-        result_boxes = \
+        # PostProcess: split the detections by their batchno column
+        result_boxes = [
             self._postprocess(
                 image=temp_image,
-                boxes=boxes,
-            )
+                boxes=boxes[boxes[:, 0] == batchno],
+            ) for batchno, temp_image in enumerate(images)
+        ]
 
-        return result_boxes
+        return result_boxes if isinstance(image, list) else result_boxes[0]
 
     def _preprocess(
         self,
@@ -308,33 +463,55 @@ class YOLOX(AbstractModel):
         image: np.ndarray
             Entire image
 
-        swap: tuple
-            HWC to CHW: (2,0,1)
-            CHW to HWC: (1,2,0)
-            HWC to HWC: (0,1,2)
-            CHW to CHW: (0,1,2)
-
         Returns
         -------
-        resized_image: np.ndarray
-            Resized and normalized image.
+        input_tensor: np.ndarray
+            Resized and batch-packed image.
+            NCHW for ONNX, NHWC for TFLite.
         """
-        # Resize + Transpose
-        resized_image = cv2.resize(
-            image,
-            (
-                int(self._input_shapes[0][self._w_index]),
-                int(self._input_shapes[0][self._h_index]),
-            )
-        )
-        resized_image = resized_image.transpose(self._swap)
-        resized_image = \
-            np.ascontiguousarray(
-                resized_image,
-                dtype=np.float32,
+        if self._swap == (2, 0, 1):
+            if self._input_dtypes[0] in [np.float32, np.float16]:
+                # Fused Resize + HWC->CHW + float32 cast + batch packing
+                input_tensor = cv2.dnn.blobFromImage(
+                    image,
+                    scalefactor=1.0,
+                    size=self._input_size,
+                    mean=(0.0, 0.0, 0.0),
+                    swapRB=False,
+                    crop=False,
+                )
+                if input_tensor.dtype != self._input_dtypes[0]:
+                    input_tensor = input_tensor.astype(self._input_dtypes[0])
+            else:
+                # Quantized models: stay in uint8/int8 end to end, no
+                # float32 detour through blobFromImage.
+                resized_image = cv2.resize(
+                    image,
+                    self._input_size,
+                    dst=self._resize_buf,
+                    interpolation=cv2.INTER_LINEAR,
+                )
+                input_tensor = \
+                    np.ascontiguousarray(
+                        resized_image.transpose(2, 0, 1)[np.newaxis, ...],
+                        dtype=self._input_dtypes[0],
+                    )
+        else:
+            # Resize only: OpenCV already returns a contiguous HWC
+            # buffer, so only the dtype cast remains.
+            resized_image = cv2.resize(
+                image,
+                self._input_size,
+                dst=self._resize_buf,
+                interpolation=cv2.INTER_LINEAR,
             )
+            input_tensor = \
+                resized_image[np.newaxis, ...].astype(
+                    self._input_dtypes[0],
+                    copy=False,
+                )
 
-        return resized_image
+        return input_tensor
 
     def _postprocess(
         self,
@@ -360,7 +537,9 @@ class YOLOX(AbstractModel):
         """
         Detector is
             N -> Number of boxes detected
-            batchno -> always 0: BatchNo.0
+            batchno -> batch index of the image the box belongs to;
+                       __call__ splits the detections on this column
+                       before handing them to _postprocess
 
         batchno_classid_score_x1y1x2y2: float32[N,7]
         """
@@ -376,21 +555,40 @@ class YOLOX(AbstractModel):
             boxes_keep = boxes[keep_idxs, :]
 
             if len(boxes_keep) > 0:
-                for box, score in zip(boxes_keep, scores_keep):
-                    x_min = int(max(0, box[3]) * image_width / self._input_shapes[0][self._w_index])
-                    y_min = int(max(0, box[4]) * image_height / self._input_shapes[0][self._h_index])
-                    x_max = int(min(box[5], self._input_shapes[0][self._w_index]) * image_width / self._input_shapes[0][self._w_index])
-                    y_max = int(min(box[6], self._input_shapes[0][self._h_index]) * image_height / self._input_shapes[0][self._h_index])
-                    result_boxes.append(
-                        Box(
-                            classid=int(box[1]),
-                            score=float(score),
-                            x1=x_min,
-                            y1=y_min,
-                            x2=x_max,
-                            y2=y_max,
-                        )
+                # Clip to the model input area and rescale to the image
+                # size without per-box Python arithmetic: a Numba-compiled
+                # kernel when available, whole-array NumPy ops otherwise.
+                input_w = self._input_w
+                input_h = self._input_h
+                if _scale_boxes is not None:
+                    xyxy, classids = _scale_boxes(
+                        boxes_keep,
+                        image_width,
+                        image_height,
+                        input_w,
+                        input_h,
                     )
+                else:
+                    scale_x = image_width / input_w
+                    scale_y = image_height / input_h
+                    xyxy = boxes_keep[:, 3:7].copy()
+                    np.clip(xyxy[:, 0::2], 0, input_w, out=xyxy[:, 0::2])
+                    np.clip(xyxy[:, 1::2], 0, input_h, out=xyxy[:, 1::2])
+                    xyxy[:, 0::2] *= scale_x
+                    xyxy[:, 1::2] *= scale_y
+                    xyxy = xyxy.astype(np.int32)
+                    classids = boxes_keep[:, 1].astype(np.int32)
+                result_boxes = [
+                    Box(
+                        classid=int(classid),
+                        score=float(score),
+                        x1=int(x_min),
+                        y1=int(y_min),
+                        x2=int(x_max),
+                        y2=int(y_max),
+                    ) for classid, score, (x_min, y_min, x_max, y_max) \
+                        in zip(classids, scores_keep[:, 0], xyxy)
+                ]
 
         return result_boxes
 
@@ -417,6 +615,153 @@ def is_package_installed(package_name: str):
     """
     return importlib.util.find_spec(package_name) is not None
 
+if is_package_installed('numba'):
+    from numba import njit # type: ignore
+
+    @njit(cache=True, fastmath=True)
+    def _scale_boxes(
+        boxes_keep: np.ndarray,
+        image_width: int,
+        image_height: int,
+        input_w: int,
+        input_h: int,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Clips and rescales score-filtered boxes with JIT-compiled
+        scalar code. Same arithmetic as the NumPy fallback in
+        YOLOX._postprocess.
+        """
+        box_count = boxes_keep.shape[0]
+        xyxy = np.empty((box_count, 4), dtype=np.int32)
+        classids = np.empty((box_count,), dtype=np.int32)
+        scale_x = image_width / input_w
+        scale_y = image_height / input_h
+        for i in range(box_count):
+            xyxy[i, 0] = int(min(max(boxes_keep[i, 3], 0.0), input_w) * scale_x)
+            xyxy[i, 1] = int(min(max(boxes_keep[i, 4], 0.0), input_h) * scale_y)
+            xyxy[i, 2] = int(min(max(boxes_keep[i, 5], 0.0), input_w) * scale_x)
+            xyxy[i, 3] = int(min(max(boxes_keep[i, 6], 0.0), input_h) * scale_y)
+            classids[i] = int(boxes_keep[i, 1])
+        return xyxy, classids
+else:
+    _scale_boxes = None
+
+def start_camera_frame_producer(
+    cap: cv2.VideoCapture,
+    frame_queue: queue.Queue,
+) -> None:
+    """Reads camera frames into a single-slot queue on a daemon thread.
+
+    Only the newest frame is kept: when the model is slower than the
+    camera, stale frames are dropped instead of backing up in the
+    capture buffer, so end-to-end latency stays bounded. A None frame
+    marks the end of the stream.
+
+    Parameters
+    ----------
+    cap: cv2.VideoCapture
+        Opened camera capture.
+
+    frame_queue: queue.Queue
+        Single-slot queue the consumer reads frames from.
+    """
+    def _producer():
+        while cap.isOpened():
+            res, image = cap.read()
+            if not res:
+                break
+            if frame_queue.full():
+                try:
+                    frame_queue.get_nowait()
+                except queue.Empty:
+                    pass
+            frame_queue.put(image)
+        frame_queue.put(None)
+    threading.Thread(target=_producer, daemon=True).start()
+
+def draw_debug_image(
+    image: np.ndarray,
+    boxes: List[Box],
+    elapsed_time: float,
+) -> np.ndarray:
+    """Draws the inference time and detected boxes onto a copy of image.
+
+    Parameters
+    ----------
+    image: np.ndarray
+        Entire image.
+
+    boxes: List[Box]
+        Predicted boxes.
+
+    elapsed_time: float
+        Inference time. [sec]
+
+    Returns
+    -------
+    debug_image: np.ndarray
+        Image with overlay drawn.
+    """
+    debug_image = image.copy()
+    debug_image_w = debug_image.shape[1]
+
+    cv2.putText(
+        debug_image,
+        f'{elapsed_time*1000:.2f} ms',
+        (10, 30),
+        FONT,
+        0.7,
+        (255, 255, 255),
+        2,
+        cv2.LINE_AA,
+    )
+    cv2.putText(
+        debug_image,
+        f'{elapsed_time*1000:.2f} ms',
+        (10, 30),
+        FONT,
+        0.7,
+        (0, 0, 255),
+        1,
+        cv2.LINE_AA,
+    )
+
+    for box in boxes:
+        color = BOX_COLORS[box.classid] \
+            if box.classid < len(BOX_COLORS) else (255, 255, 255)
+        cv2.rectangle(
+            debug_image,
+            (box.x1, box.y1),
+            (box.x2, box.y2),
+            color,
+            2,
+        )
+        text_org = (
+            box.x1 if box.x1+50 < debug_image_w else debug_image_w-50,
+            box.y1-10 if box.y1-25 > 0 else 20
+        )
+        cv2.putText(
+            debug_image,
+            f'{box.score:.2f}',
+            text_org,
+            FONT,
+            0.7,
+            (255, 255, 255),
+            2,
+            cv2.LINE_AA,
+        )
+        cv2.putText(
+            debug_image,
+            f'{box.score:.2f}',
+            text_org,
+            FONT,
+            0.7,
+            color,
+            1,
+            cv2.LINE_AA,
+        )
+
+    return debug_image
+
 
 def main():
     parser = ArgumentParser()
@@ -434,6 +779,13 @@ def main():
         default="0",
         help='Video file path or camera index.',
     )
+    parser.add_argument(
+        '-o',
+        '--output',
+        type=str,
+        default='output.mp4',
+        help='Output MP4 file path for the annotated video.',
+    )
     parser.add_argument(
         '-ep',
         '--execution_provider',
@@ -442,6 +794,15 @@ def main():
         default='cpu',
         help='Execution provider for ONNXRuntime.',
     )
+    parser.add_argument(
+        '-b',
+        '--batch',
+        type=int,
+        default=1,
+        help=\
+            'Number of frames inferred as one batch. '+
+            'Values larger than 1 require a model exported with a dynamic batch dimension.',
+    )
     parser.add_argument(
         '-dvw',
         '--disable_video_writer',
@@ -480,22 +841,50 @@ def main():
             'CPUExecutionProvider',
         ]
     elif execution_provider == 'cuda':
+        # CUDA graph capture is not usable here: the in-graph NMS has no
+        # CUDA kernel and produces a data-dependent number of boxes, so
+        # capture would fail at session init (or replay stale outputs).
         providers = [
             'CUDAExecutionProvider',
             'CPUExecutionProvider',
         ]
     elif execution_provider == 'tensorrt':
+        # Key the engine/timing caches to the model contents and dump an
+        # EP context model so subsequent launches skip the TensorRT
+        # engine build (tens of seconds on Jetson class devices).
+        with open(model_file, 'rb') as f:
+            model_hash = hashlib.md5(f.read()).hexdigest()[:12]
+        context_model_file = f'{model_file}.ctx.onnx'
+        trt_provider_options = {
+            'trt_engine_cache_enable': True,
+            'trt_engine_cache_path': '.',
+            'trt_engine_cache_prefix': model_hash,
+            'trt_timing_cache_enable': True,
+            'trt_timing_cache_path': '.',
+            'trt_fp16_enable': True,
+            'trt_builder_optimization_level': 5,
+            'trt_dump_ep_context_model': True,
+            'trt_ep_context_file_path': context_model_file,
+        }
+        if 'int8' in os.path.basename(model_file).lower():
+            # Quantized models (see the quantization folder for the
+            # offline calibration scripts) run as INT8 engines.
+            trt_provider_options.update({
+                'trt_int8_enable': True,
+                'trt_int8_calibration_table_name': 'calib.cache',
+                'trt_int8_use_native_calibration_table': True,
+            })
         providers = [
             (
-                'TensorrtExecutionProvider', {
-                    'trt_engine_cache_enable': True,
-                    'trt_engine_cache_path': '.',
-                    'trt_fp16_enable': True,
-                }
+                'TensorrtExecutionProvider', trt_provider_options
             ),
             'CUDAExecutionProvider',
             'CPUExecutionProvider',
         ]
+        if os.path.exists(context_model_file):
+            # The context model embeds the prebuilt engine, so loading it
+            # skips ONNX parsing and the engine build entirely.
+            model_file = context_model_file
 
     # Model initialization
     model = YOLOX(
@@ -505,112 +894,110 @@ def main():
         providers=providers,
     )
 
+    is_camera_input = is_parsable_to_int(video)
     cap = cv2.VideoCapture(
-        int(video) if is_parsable_to_int(video) else video
+        int(video) if is_camera_input else video
     )
     disable_video_writer: bool = args.disable_video_writer
+    output_file: str = args.output
     video_writer = None
     if not disable_video_writer:
         cap_fps = cap.get(cv2.CAP_PROP_FPS)
         w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        # Prefer H.264 (avc1), which the FFmpeg backend maps to a
+        # hardware encoder where one is available; fall back to the
+        # software mp4v encoder when no H.264 encoder is built in.
         video_writer = cv2.VideoWriter(
-            filename='output.mp4',
-            fourcc=fourcc,
+            filename=output_file,
+            fourcc=cv2.VideoWriter_fourcc(*'avc1'),
             fps=cap_fps,
             frameSize=(w, h),
         )
+        if not video_writer.isOpened():
+            video_writer = cv2.VideoWriter(
+                filename=output_file,
+                fourcc=cv2.VideoWriter_fourcc(*'mp4v'),
+                fps=cap_fps,
+                frameSize=(w, h),
+            )
 
-    while cap.isOpened():
-        res, image = cap.read()
-        if not res:
-            break
+    # Live cameras are read on a producer thread that keeps only the
+    # newest frame; video files keep the strictly sequential read path.
+    frame_queue: Optional[queue.Queue] = None
+    if is_camera_input:
+        frame_queue = queue.Queue(maxsize=1)
+        start_camera_frame_producer(cap, frame_queue)
+
+    # Two-stage pipeline: frame N runs through the model on a worker
+    # thread while frame N-1 is drawn, displayed and encoded here, so
+    # the drawing/encoding cost is hidden behind the inference time.
+    inference_executor = ThreadPoolExecutor(max_workers=1)
+    pending = None
+
+    def timed_inference(images: List[np.ndarray]):
+        # Measured on the worker so the overlay shows the pure model
+        # time, not the wait behind the previous in-flight batch.
+        start_time = time.perf_counter()
+        results = model(images)
+        return results, time.perf_counter() - start_time
 
-        debug_image = copy.deepcopy(image)
-        # debug_image_h = debug_image.shape[0]
-        debug_image_w = debug_image.shape[1]
+    def present(pending) -> bool:
+        """Finishes an in-flight inference and shows/records its frames.
+        Returns False when ESC was pressed.
+        """
+        images, future = pending
+        results, elapsed_time = future.result()
+        for image, boxes in zip(images, results):
+            debug_image = draw_debug_image(image, boxes, elapsed_time)
+
+            key = cv2.waitKey(1)
+            if key == 27: # ESC
+                return False
+
+            cv2.imshow("test", debug_image)
+            if video_writer is not None:
+                video_writer.write(debug_image)
+        return True
 
-        start_time = time.perf_counter()
-        boxes = model(debug_image)
-        elapsed_time = time.perf_counter() - start_time
-        cv2.putText(
-            debug_image,
-            f'{elapsed_time*1000:.2f} ms',
-            (10, 30),
-            cv2.FONT_HERSHEY_SIMPLEX,
-            0.7,
-            (255, 255, 255),
-            2,
-            cv2.LINE_AA,
-        )
-        cv2.putText(
-            debug_image,
-            f'{elapsed_time*1000:.2f} ms',
-            (10, 30),
-            cv2.FONT_HERSHEY_SIMPLEX,
-            0.7,
-            (0, 0, 255),
-            1,
-            cv2.LINE_AA,
-        )
+    batch_size: int = max(1, args.batch)
+    batch_images: List[np.ndarray] = []
+    while cap.isOpened():
+        if frame_queue is not None:
+            image = frame_queue.get()
+            if image is None:
+                break
+        else:
+            res, image = cap.read()
+            if not res:
+                break
 
-        for box in boxes:
-            color = (255,255,255)
-            if box.classid == 0:
-                color = (255,0,0)
-            elif box.classid == 1:
-                color = (0,0,255)
-            elif box.classid == 2:
-                color = (0,255,0)
-            cv2.rectangle(
-                debug_image,
-                (box.x1, box.y1),
-                (box.x2, box.y2),
-                (255,255,255),
-                2,
-            )
-            cv2.rectangle(
-                debug_image,
-                (box.x1, box.y1),
-                (box.x2, box.y2),
-                color,
-                1,
-            )
-            cv2.putText(
-                debug_image,
-                f'{box.score:.2f}',
-                (
-                    box.x1 if box.x1+50 < debug_image_w else debug_image_w-50,
-                    box.y1-10 if box.y1-25 > 0 else 20
-                ),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                0.7,
-                (255, 255, 255),
-                2,
-                cv2.LINE_AA,
-            )
-            cv2.putText(
-                debug_image,
-                f'{box.score:.2f}',
-                (
-                    box.x1 if box.x1+50 < debug_image_w else debug_image_w-50,
-                    box.y1-10 if box.y1-25 > 0 else 20
-                ),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                0.7,
-                color,
-                1,
-                cv2.LINE_AA,
-            )
+        batch_images.append(image)
+        if len(batch_images) < batch_size:
+            continue
 
-        key = cv2.waitKey(1)
-        if key == 27: # ESC
+        submitted = (
+            batch_images,
+            inference_executor.submit(timed_inference, batch_images),
+        )
+        batch_images = []
+        if pending is not None and not present(pending):
+            pending = None
             break
+        pending = submitted
 
-        cv2.imshow("test", debug_image)
-        if video_writer is not None:
-            video_writer.write(debug_image)
+    # Flush the trailing partial batch and the last in-flight inference
+    if batch_images:
+        submitted = (
+            batch_images,
+            inference_executor.submit(timed_inference, batch_images),
+        )
+        if pending is not None:
+            present(pending)
+        pending = submitted
+    if pending is not None:
+        present(pending)
+    inference_executor.shutdown()
 
     if video_writer is not None:
         video_writer.release()